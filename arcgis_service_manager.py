@@ -1,480 +1,949 @@
-#!/usr/bin/env python3
-"""
-ArcGIS Server Service Manager
-
-This script manages ArcGIS Server services through the REST API.
-It can save current service states, stop services (except one), or restore services from a saved state.
-
-Requirements:
-    Use the Python that comes with ArcGIS Pro or ArcGIS Server (e.g. "c:\Program Files\ArcGIS\Server\framework\runtime\ArcGIS\bin\Python\Scripts\propy.bat")
-
-Usage:
-    python arcgis_service_manager.py save --server https://your-server:6443 --username admin --password yourpass --output services.csv
-    python arcgis_service_manager.py stop --server https://your-server:6443 --username admin --password yourpass --keep-service "MyService"
-    python arcgis_service_manager.py restore --server https://your-server:6443 --username admin --password yourpass --input services.csv
-"""
-
-import requests
-import json
-import csv
-import argparse
-import sys
-import urllib.parse
-from typing import Dict, List, Optional, Tuple
-
-
-class ArcGISServerManager:
-    def __init__(self, server_url: str, username: str, password: str):
-        """
-        Initialize the ArcGIS Server manager.
-        
-        Args:
-            server_url: Base URL of the ArcGIS Server (e.g., https://server:6443)
-            username: Primary Site Administrator username
-            password: Primary Site Administrator password
-        """
-        self.server_url = server_url.rstrip('/')
-        self.username = username
-        self.password = password
-        self.token = None
-        self.excluded_folders = {'Hosted', 'System', 'Utilities'}
-        self.session = requests.Session()
-        
-    def authenticate(self) -> bool:
-        """
-        Authenticate with ArcGIS Server and obtain a token.
-        
-        Returns:
-            bool: True if authentication successful, False otherwise
-        """
-        auth_url = f"{self.server_url}/arcgis/admin/generateToken"
-        
-        auth_data = {
-            'username': self.username,
-            'password': self.password,
-            'client': 'requestip',
-            'f': 'json'
-        }
-        
-        try:
-            response = self.session.post(auth_url, data=auth_data, verify=False)
-            response.raise_for_status()
-            
-            result = response.json()
-            if 'token' in result:
-                self.token = result['token']
-                print("Authentication successful")
-                return True
-            else:
-                print(f"Authentication failed: {result.get('error', {}).get('message', 'Unknown error')}")
-                return False
-                
-        except requests.RequestException as e:
-            print(f"Authentication request failed: {e}")
-            return False
-    
-    def _make_request(self, endpoint: str, data: Dict = None, method: str = 'GET') -> Optional[Dict]:
-        """
-        Make an authenticated request to the ArcGIS Server REST API.
-        
-        Args:
-            endpoint: API endpoint (relative to /arcgis/admin/)
-            data: Request data for POST requests
-            method: HTTP method ('GET' or 'POST')
-            
-        Returns:
-            Response JSON as dict, or None if request failed
-        """
-        if not self.token:
-            print("Not authenticated. Call authenticate() first.")
-            return None
-            
-        url = f"{self.server_url}/arcgis/admin/{endpoint}"
-        
-        # Add token to request data
-        request_data = data.copy() if data else {}
-        request_data['token'] = self.token
-        request_data['f'] = 'json'
-        
-        try:
-            if method.upper() == 'GET':
-                response = self.session.get(url, params=request_data, verify=False)
-            else:
-                response = self.session.post(url, data=request_data, verify=False)
-                
-            response.raise_for_status()
-            result = response.json()
-            
-            if 'error' in result:
-                print(f"API Error: {result['error'].get('message', 'Unknown error')}")
-                return None
-                
-            return result
-            
-        except requests.RequestException as e:
-            print(f"Request failed: {e}")
-            return None
-    
-    def get_services(self) -> List[Dict]:
-        """
-        Get all services from the ArcGIS Server.
-        
-        Returns:
-            List of service dictionaries with folder, name, and type information
-        """
-        services = []
-        
-        # Get services in root folder
-        result = self._make_request('services')
-        if result and 'services' in result:
-            for service in result['services']:
-                services.append({
-                    'folder': '',
-                    'name': service['serviceName'],
-                    'type': service['type']
-                })
-        
-        # Get services in subfolders
-        if result and 'folders' in result:
-            for folder in result['folders']:
-                folder_result = self._make_request(f'services/{folder}')
-                if folder_result and 'services' in folder_result:
-                    for service in folder_result['services']:
-                        services.append({
-                            'folder': folder,
-                            'name': service['serviceName'],
-                            'type': service['type']
-                        })
-        
-        return services
-    
-    def get_service_details(self, folder: str, service_name: str, service_type: str) -> Optional[Dict]:
-        """
-        Get detailed information about a specific service.
-        
-        Args:
-            folder: Service folder (empty string for root)
-            service_name: Service name
-            service_type: Service type (e.g., 'MapServer')
-            
-        Returns:
-            Service details dictionary
-        """
-        if folder:
-            endpoint = f'services/{folder}/{service_name}.{service_type}'
-        else:
-            endpoint = f'services/{service_name}.{service_type}'
-            
-        return self._make_request(endpoint)
-    
-    def start_service(self, folder: str, service_name: str, service_type: str) -> bool:
-        """Start a service."""
-        if folder:
-            endpoint = f'services/{folder}/{service_name}.{service_type}/start'
-        else:
-            endpoint = f'services/{service_name}.{service_type}/start'
-            
-        result = self._make_request(endpoint, method='POST')
-        return result is not None and result.get('status') == 'success'
-    
-    def stop_service(self, folder: str, service_name: str, service_type: str) -> bool:
-        """Stop a service."""
-        if folder:
-            endpoint = f'services/{folder}/{service_name}.{service_type}/stop'
-        else:
-            endpoint = f'services/{service_name}.{service_type}/stop'
-            
-        result = self._make_request(endpoint, method='POST')
-        return result is not None and result.get('status') == 'success'
-    
-    def update_service_instances(self, folder: str, service_name: str, service_type: str, 
-                               min_instances: int, max_instances: int) -> bool:
-        """
-        Update the min/max instances for a service.
-        
-        Args:
-            folder: Service folder
-            service_name: Service name
-            service_type: Service type
-            min_instances: Minimum instances
-            max_instances: Maximum instances
-            
-        Returns:
-            True if successful, False otherwise
-        """
-        # First get current service configuration
-        service_details = self.get_service_details(folder, service_name, service_type)
-        if not service_details:
-            return False
-        
-        # Update instance settings
-        service_details['minInstancesPerNode'] = min_instances
-        service_details['maxInstancesPerNode'] = max_instances
-        
-        # Remove read-only properties that shouldn't be in the edit request
-        readonly_props = ['status', 'configuredState', 'realTimeState', 'extensions']
-        for prop in readonly_props:
-            service_details.pop(prop, None)
-        
-        if folder:
-            endpoint = f'services/{folder}/{service_name}.{service_type}/edit'
-        else:
-            endpoint = f'services/{service_name}.{service_type}/edit'
-            
-        edit_data = {
-            'service': json.dumps(service_details)
-        }
-        
-        result = self._make_request(endpoint, data=edit_data, method='POST')
-        return result is not None and result.get('status') == 'success'
-    
-    def save_services_state(self, output_file: str) -> bool:
-        """
-        Save current service states and instance settings to CSV.
-        
-        Args:
-            output_file: Output CSV file path
-            
-        Returns:
-            True if successful, False otherwise
-        """
-        
-        skipped_count = 0
-        
-        services = self.get_services()
-        if not services:
-            print("No services found or failed to retrieve services")
-            return False
-        
-        try:
-            with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['folder', 'service_name', 'service_type', 'configured_state', 
-                            'min_instances', 'max_instances']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for service in services:
-                    
-                    # Skip services in excluded folders
-                    if service['folder'] in self.excluded_folders:
-                        service_path = f"{service['folder']}/{service['name']}.{service['type']}"
-                        print(f"Skipping excluded service: {service_path}")
-                        skipped_count += 1
-                        continue
-                    
-                    details = self.get_service_details(service['folder'], service['name'], service['type'])
-                    if details:
-                        writer.writerow({
-                            'folder': service['folder'],
-                            'service_name': service['name'],
-                            'service_type': service['type'],
-                            'configured_state': details.get('configuredState', 'STOPPED'),
-                            'min_instances': details.get('minInstancesPerNode', 1),
-                            'max_instances': details.get('maxInstancesPerNode', 1)
-                        })
-                        print(f"Saved: {service['folder']}/{service['name']}.{service['type']}")
-            
-            print(f"Service states saved to {output_file}")
-            return True
-            
-        except Exception as e:
-            print(f"Failed to save services state: {e}")
-            return False
-    
-    def stop_all_except_one(self, keep_service: str) -> bool:
-        """
-        Stop all services except one, and set that service's instances to 1/1.
-        
-        Args:
-            keep_service: Name of the service to keep running
-            
-        Returns:
-            True if successful, False otherwise
-        """
-        
-        skipped_count = 0
-        
-        services = self.get_services()
-        if not services:
-            print("No services found or failed to retrieve services")
-            return False
-        
-        kept_service_found = False
-        
-        for service in services:
-            
-            service_full_name = f"{service['name']}.{service['type']}"
-            service_path = f"{service['folder']}/{service_full_name}" if service['folder'] else service_full_name
-
-            # Skip services in excluded folders
-            if service['folder'] in self.excluded_folders:
-                service_path = f"{service['folder']}/{service['name']}.{service['type']}"
-                print(f"Skipping excluded service: {service_path}")
-                skipped_count += 1
-                continue
-            
-            if service['name'] == keep_service:
-                # This is the service to keep running
-                print(f"Keeping service running: {service_path}")
-                
-                # Set instances to 1/1
-                if self.update_service_instances(service['folder'], service['name'], 
-                                               service['type'], 1, 1):
-                    print(f"Updated instances to 1/1 for {service_path}")
-                else:
-                    print(f"Failed to update instances for {service_path}")
-                
-                # Ensure it's started
-                if self.start_service(service['folder'], service['name'], service['type']):
-                    print(f"Started service: {service_path}")
-                else:
-                    print(f"Failed to start service: {service_path}")
-                
-                kept_service_found = True
-            else:
-                # Stop this service
-                if self.stop_service(service['folder'], service['name'], service['type']):
-                    print(f"Stopped service: {service_path}")
-                else:
-                    print(f"Failed to stop service: {service_path}")
-        
-        if not kept_service_found:
-            print(f"Warning: Service '{keep_service}' not found!")
-            return False
-        
-        print("Service shutdown complete")
-        return True
-    
-    def restore_services_state(self, input_file: str) -> bool:
-        """
-        Restore service states and instance settings from CSV.
-        Excludes services in Hosted, System, and Utilities folders.
-        
-        Args:
-            input_file: Input CSV file path
-            
-        Returns:
-            True if successful, False otherwise
-        """
-        try:
-            restored_count = 0
-            skipped_count = 0
-            
-            with open(input_file, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                
-                for row in reader:
-                    folder = row['folder']
-                    service_name = row['service_name']
-                    service_type = row['service_type']
-                    configured_state = row['configured_state']
-                    min_instances = int(row['min_instances'])
-                    max_instances = int(row['max_instances'])
-                    
-                    # Skip services in excluded folders
-                    if folder in self.excluded_folders:
-                        service_path = f"{folder}/{service_name}.{service_type}"
-                        print(f"Skipping excluded service: {service_path}")
-                        skipped_count += 1
-                        continue
-                    
-                    service_path = f"{folder}/{service_name}.{service_type}" if folder else f"{service_name}.{service_type}"
-                    
-                    # Update instances
-                    if self.update_service_instances(folder, service_name, service_type, 
-                                                   min_instances, max_instances):
-                        print(f"Updated instances for {service_path}: {min_instances}/{max_instances}")
-                    else:
-                        print(f"Failed to update instances for {service_path}")
-                        continue
-                    
-                    # Set service state
-                    if configured_state.upper() == 'STARTED':
-                        if self.start_service(folder, service_name, service_type):
-                            print(f"Started service: {service_path}")
-                            restored_count += 1
-                        else:
-                            print(f"Failed to start service: {service_path}")
-                    else:
-                        if self.stop_service(folder, service_name, service_type):
-                            print(f"Stopped service: {service_path}")
-                            restored_count += 1
-                        else:
-                            print(f"Failed to stop service: {service_path}")
-            
-            print(f"Service restoration complete ({restored_count} services restored, {skipped_count} services skipped)")
-            if skipped_count > 0:
-                print(f"Excluded folders: {', '.join(self.excluded_folders)}")
-            return True
-            
-        except FileNotFoundError:
-            print(f"Input file '{input_file}' not found")
-            return False
-        except Exception as e:
-            print(f"Failed to restore services state: {e}")
-            return False
-
-
-def main():
-    parser = argparse.ArgumentParser(description='ArcGIS Server Service Manager')
-    subparsers = parser.add_subparsers(dest='command', help='Available commands')
-    
-    # Common arguments for all commands
-    def add_common_args(subparser):
-        subparser.add_argument('--server', required=True, 
-                             help='ArcGIS Server URL (e.g., https://server:6443)')
-        subparser.add_argument('--username', required=True,
-                             help='Primary Site Administrator username')
-        subparser.add_argument('--password', required=True,
-                             help='Primary Site Administrator password')
-    
-    # Save command
-    save_parser = subparsers.add_parser('save', help='Save current service states to CSV')
-    add_common_args(save_parser)
-    save_parser.add_argument('--output', required=True,
-                           help='Output CSV file path')
-    
-    # Stop command
-    stop_parser = subparsers.add_parser('stop', help='Stop all services except one')
-    add_common_args(stop_parser)
-    stop_parser.add_argument('--keep-service', required=True,
-                           help='Name of service to keep running')
-    
-    # Restore command
-    restore_parser = subparsers.add_parser('restore', help='Restore service states from CSV')
-    add_common_args(restore_parser)
-    restore_parser.add_argument('--input', required=True,
-                              help='Input CSV file path')
-    
-    args = parser.parse_args()
-    
-    if not args.command:
-        parser.print_help()
-        return 1
-    
-    # Disable SSL warnings (adjust as needed for your environment)
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    # Initialize manager and authenticate
-    manager = ArcGISServerManager(args.server, args.username, args.password)
-    
-    if not manager.authenticate():
-        print("Authentication failed")
-        return 1
-    
-    # Execute command
-    success = False
-    
-    if args.command == 'save':
-        success = manager.save_services_state(args.output)
-    elif args.command == 'stop':
-        success = manager.stop_all_except_one(args.keep_service)
-    elif args.command == 'restore':
-        success = manager.restore_services_state(args.input)
-    
-    return 0 if success else 1
-
-
-if __name__ == '__main__':
+#!/usr/bin/env python3
+"""
+ArcGIS Server Service Manager
+
+This script manages ArcGIS Server services through the REST API.
+It can save current service states, stop services (except one), or restore services from a saved state.
+
+Requirements:
+    Use the Python that comes with ArcGIS Pro or ArcGIS Server (e.g. "c:\Program Files\ArcGIS\Server\framework\runtime\ArcGIS\bin\Python\Scripts\propy.bat")
+
+Usage:
+    python arcgis_service_manager.py save --server https://your-server:6443 --username admin --password yourpass --output services.csv
+    python arcgis_service_manager.py stop --server https://your-server:6443 --username admin --password yourpass --keep-service "MyService"
+    python arcgis_service_manager.py restore --server https://your-server:6443 --username admin --password yourpass --input services.csv
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import json
+import csv
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Use orjson (or ujson) when available: parsing the large service-details
+# payloads is the CPU hotspot after network I/O. Fall back to the stdlib so
+# the script still runs unchanged under ArcGIS's bundled Python.
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    try:
+        import ujson
+        _json_loads = ujson.loads
+        _json_dumps = ujson.dumps
+    except ImportError:
+        _json_loads = json.loads
+        _json_dumps = json.dumps
+
+# ijson parses folder listings incrementally as bytes arrive, so a large
+# response never has to be buffered and decoded in one piece.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# pandas (bundled with ArcGIS's Python) parses large state CSVs in one
+# vectorized pass; the csv module remains the fallback.
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# Optional HTTP/2 transport: httpx can multiplex all the per-service calls
+# over a single TLS connection. requests remains the default transport so the
+# script still runs under ArcGIS's bundled Python without extra packages.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+if httpx is not None:
+    _REQUEST_ERRORS = (requests.RequestException, httpx.HTTPError)
+else:
+    _REQUEST_ERRORS = (requests.RequestException,)
+
+logger = logging.getLogger(__name__)
+
+# Disable SSL warnings (adjust as needed for your environment)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Read-only service properties that must not be sent back on /edit
+_READONLY_PROPS = frozenset({'status', 'configuredState', 'realTimeState', 'extensions'})
+
+
+class ArcGISServerManager:
+    def __init__(self, server_url: str, username: str, password: str):
+        """
+        Initialize the ArcGIS Server manager.
+        
+        Args:
+            server_url: Base URL of the ArcGIS Server (e.g., https://server:6443)
+            username: Primary Site Administrator username
+            password: Primary Site Administrator password
+        """
+        self.server_url = server_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.token = None
+        self._token_from_cache = False
+        self.excluded_folders = {'Hosted', 'System', 'Utilities'}
+        self.max_workers = 16
+        # Both caches are shared across thread-pool workers; every read,
+        # write, and invalidation must hold the lock
+        self._details_cache: Dict[Tuple[str, str, str], Dict] = {}
+        self._get_cache: Dict[Tuple, Dict] = {}
+        self._cache_lock = threading.Lock()
+        # Thread-local so each worker sees the API error from its own request
+        self._local = threading.local()
+        self._supports_partial_edit = True
+        self.session = requests.Session()
+
+        # Ask for compressed JSON over kept-alive connections; urllib3
+        # transparently decompresses gzip/deflate responses
+        default_headers = {
+            'Accept-Encoding': 'gzip, deflate',
+            'Accept': 'application/json',
+            'Connection': 'keep-alive'
+        }
+        self.session.headers.update(default_headers)
+
+        # HTTP/2 multiplexing is opt-in via ARCGIS_SVCMGR_HTTP2=1 so that
+        # merely installing httpx cannot reroute traffic off the requests
+        # session, which carries the urllib3 retry policy and the streaming
+        # listing path. timeout=None matches the untimed requests path: admin
+        # start/stop/edit POSTs routinely run longer than httpx's 5-second
+        # default. The transport retries cover connection failures; 5xx
+        # responses are not retried on this path.
+        self._http2_client = None
+        if (httpx is not None
+                and os.environ.get('ARCGIS_SVCMGR_HTTP2', '').lower() in ('1', 'true', 'yes')):
+            try:
+                transport = httpx.HTTPTransport(http2=True, verify=False, retries=3)
+                self._http2_client = httpx.Client(transport=transport,
+                                                  timeout=None,
+                                                  headers=default_headers)
+            except ImportError:
+                pass
+
+        # Size the connection pool for parallel workers so keep-alive connections
+        # are reused instead of being evicted and re-established (TLS handshakes)
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.3,
+                              status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @staticmethod
+    def _endpoint(folder: str, service_name: str, service_type: str,
+                  action: str = '') -> str:
+        """Build a service endpoint path, optionally with a trailing action."""
+        if folder:
+            base = f'services/{folder}/{service_name}.{service_type}'
+        else:
+            base = f'services/{service_name}.{service_type}'
+        return f'{base}/{action}' if action else base
+
+    def _http_get(self, url: str, params: Dict):
+        """GET through the HTTP/2 client when available, else the session."""
+        if self._http2_client is not None:
+            return self._http2_client.get(url, params=params)
+        return self.session.get(url, params=params, verify=False)
+
+    def _http_post(self, url: str, data: Dict):
+        """POST through the HTTP/2 client when available, else the session."""
+        if self._http2_client is not None:
+            return self._http2_client.post(url, data=data)
+        return self.session.post(url, data=data, verify=False)
+
+
+    def _token_cache_path(self) -> str:
+        """Return the on-disk cache path for this server/user's admin token."""
+        key = hashlib.sha256(f"{self.server_url}|{self.username}".encode()).hexdigest()
+        return os.path.join(os.path.expanduser('~'), '.cache', 'arcgis_svcmgr',
+                            f'{key}.json')
+
+    def _load_cached_token(self) -> Optional[str]:
+        """Return a cached token if one exists and has not expired."""
+        try:
+            with open(self._token_cache_path(), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            # Leave a minute of slack so the token doesn't expire mid-run
+            if cached.get('expires', 0) > time.time() + 60:
+                return cached.get('token')
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _store_cached_token(self, token: str, expires_ms: int):
+        """Write the token and its expiry to disk (best-effort, owner-only)."""
+        path = self._token_cache_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Create the file owner-only from the start so the token is never
+            # world-readable, even briefly
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'token': token, 'expires': expires_ms / 1000.0}, f)
+        except OSError:
+            pass
+
+    def _delete_cached_token(self):
+        """Remove the on-disk token cache entry for this server/user."""
+        try:
+            os.remove(self._token_cache_path())
+        except OSError:
+            pass
+
+    def authenticate(self) -> bool:
+        """
+        Authenticate with ArcGIS Server and obtain a token.
+
+        Reuses a token cached from a previous run when it is still valid,
+        so back-to-back save/stop/restore invocations skip generateToken.
+
+        Returns:
+            bool: True if authentication successful, False otherwise
+        """
+        cached_token = self._load_cached_token()
+        if cached_token:
+            self.token = cached_token
+            self._token_from_cache = True
+            logger.info("Authentication successful (cached token)")
+            return True
+
+        auth_url = f"{self.server_url}/arcgis/admin/generateToken"
+
+        auth_data = {
+            'username': self.username,
+            'password': self.password,
+            'client': 'requestip',
+            'expiration': '1440',
+            'f': 'json'
+        }
+
+        try:
+            response = self._http_post(auth_url, auth_data)
+            response.raise_for_status()
+
+            result = response.json()
+            if 'token' in result:
+                self.token = result['token']
+                self._token_from_cache = False
+                if 'expires' in result:
+                    self._store_cached_token(result['token'], int(result['expires']))
+                logger.info("Authentication successful")
+                return True
+            else:
+                logger.error(f"Authentication failed: {result.get('error', {}).get('message', 'Unknown error')}")
+                return False
+                
+        except _REQUEST_ERRORS as e:
+            logger.error(f"Authentication request failed: {e}")
+            return False
+    
+    def _make_request(self, endpoint: str, data: Dict = None, method: str = 'GET',
+                      fmt: str = 'json') -> Optional[Dict]:
+        """
+        Make an authenticated request to the ArcGIS Server REST API.
+        
+        Args:
+            endpoint: API endpoint (relative to /arcgis/admin/)
+            data: Request data for POST requests
+            method: HTTP method ('GET' or 'POST')
+            fmt: Response format passed as the 'f' parameter. The Admin API
+                only honors 'json'; compact encodings like 'pbf' exist only on
+                the public REST services endpoints, so non-JSON formats return
+                the raw response bytes for the caller to decode.
+
+        Returns:
+            Response JSON as dict (raw bytes for non-JSON formats), or None
+            if the request failed
+        """
+        if not self.token:
+            logger.error("Not authenticated. Call authenticate() first.")
+            return None
+
+        url = f"{self.server_url}/arcgis/admin/{endpoint}"
+
+        # Read-only JSON GETs are memoized for the duration of the run;
+        # _invalidate_details_cache drops entries when a service changes
+        cache_key = None
+        if method.upper() == 'GET' and fmt == 'json':
+            cache_key = (endpoint, frozenset(data.items()) if data else None)
+            with self._cache_lock:
+                if cache_key in self._get_cache:
+                    return self._get_cache[cache_key]
+
+        # Add token to request data
+        request_data = data.copy() if data else {}
+        request_data['token'] = self.token
+        request_data['f'] = fmt
+
+        self._local.last_api_error = None
+
+        try:
+            if method.upper() == 'GET':
+                response = self._http_get(url, request_data)
+            else:
+                response = self._http_post(url, request_data)
+
+            response.raise_for_status()
+            if fmt != 'json':
+                return response.content
+            result = _json_loads(response.content)
+            
+            if 'error' in result:
+                error = result['error']
+                # A cached token can be invalidated server-side (shared-key
+                # rotation, site restore, clock skew) long before its local
+                # expiry; drop it and re-authenticate once with generateToken
+                if self._token_from_cache and self._is_token_error(error):
+                    logger.warning("Cached token rejected by server; re-authenticating")
+                    self._delete_cached_token()
+                    self.token = None
+                    self._token_from_cache = False
+                    if self.authenticate():
+                        return self._make_request(endpoint, data=data,
+                                                  method=method, fmt=fmt)
+                self._local.last_api_error = error
+                logger.error(f"API Error: {error.get('message', 'Unknown error')}")
+                return None
+
+            if cache_key is not None:
+                with self._cache_lock:
+                    self._get_cache[cache_key] = result
+            return result
+            
+        except _REQUEST_ERRORS as e:
+            logger.error(f"Request failed: {e}")
+            return None
+    
+    @staticmethod
+    def _is_token_error(error: Dict) -> bool:
+        """True when an API error indicates the token was rejected."""
+        if error.get('code') in (498, 499):
+            return True
+        return 'token' in error.get('message', '').lower()
+
+    def _stream_folder_listing(self, endpoint: str) -> Optional[Dict]:
+        """
+        Fetch a folder listing with a streaming parse: ijson decodes the
+        services array as bytes arrive instead of buffering the whole
+        response and parsing it in one piece.
+
+        Returns:
+            A dict shaped like the _make_request response ({'services': [...]}),
+            or None when streaming is unavailable (no ijson, HTTP/2 transport
+            in use, or the request failed) so the caller can fall back.
+        """
+        if ijson is None or self._http2_client is not None or not self.token:
+            return None
+
+        url = f"{self.server_url}/arcgis/admin/{endpoint}"
+        params = {'token': self.token, 'f': 'json'}
+
+        try:
+            with self.session.get(url, params=params, verify=False,
+                                  stream=True) as response:
+                response.raise_for_status()
+                # Responses arrive gzip-compressed; decode before parsing
+                response.raw.decode_content = True
+                items = list(ijson.items(response.raw, 'services.item'))
+                if not items:
+                    # An HTTP-200 error payload (expired token, folder
+                    # permissions) has no services array and streams as
+                    # nothing; re-fetch through _make_request so the error
+                    # is parsed and surfaced instead of silently dropping
+                    # the folder. A genuinely empty folder re-fetches too,
+                    # which is cheap.
+                    return None
+                return {'services': items}
+        except _REQUEST_ERRORS as e:
+            logger.error(f"Request failed: {e}")
+            return None
+        except ijson.JSONError as e:
+            logger.error(f"Failed to stream {endpoint}: {e}")
+            return None
+
+    def get_services(self, include_excluded: bool = False) -> List[Dict]:
+        """
+        Get all services from the ArcGIS Server.
+
+        Args:
+            include_excluded: Also enumerate folders in self.excluded_folders
+                (skipped by default so their services are never fetched)
+
+        Returns:
+            List of service dictionaries with folder, name, and type information
+        """
+        services = []
+        
+        # Get services in root folder
+        result = self._make_request('services')
+        if result and 'services' in result:
+            for service in result['services']:
+                services.append({
+                    'folder': '',
+                    'name': service['serviceName'],
+                    'type': service['type']
+                })
+        
+        # Get services in subfolders. A single services/report call covers every
+        # folder in one round-trip; fall back to per-folder listings (in parallel)
+        # if the server does not support it.
+        folders = result.get('folders', []) if result else []
+        if not include_excluded:
+            for folder in folders:
+                if folder in self.excluded_folders:
+                    logger.warning(f"Skipping excluded folder: {folder}")
+            folders = [f for f in folders if f not in self.excluded_folders]
+
+        if folders:
+            report = self._make_request('services/report',
+                                        data={'folders': ','.join(folders)})
+            if report and 'reports' in report:
+                for entry in report['reports']:
+                    services.append({
+                        'folder': entry.get('folderName', ''),
+                        'name': entry['serviceName'],
+                        'type': entry['type']
+                    })
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    folder_results = executor.map(
+                        lambda f: (f, self._stream_folder_listing(f'services/{f}')
+                                   or self._make_request(f'services/{f}')), folders)
+                    for folder, folder_result in folder_results:
+                        if folder_result and 'services' in folder_result:
+                            for service in folder_result['services']:
+                                services.append({
+                                    'folder': folder,
+                                    'name': service['serviceName'],
+                                    'type': service['type']
+                                })
+
+        return services
+
+    def _get_service_reports(self, folders: List[str], detail: bool = False) -> List[Dict]:
+        """
+        Fetch services/report entries for the given folders.
+
+        Args:
+            folders: Folder names to report on; include '' for the root folder
+            detail: Request the detailed report, which includes
+                configuredState and instance settings per service
+
+        Returns:
+            List of report entries; empty if the server does not support
+            services/report
+        """
+        entries = []
+
+        report_params = []
+        subfolders = [f for f in folders if f]
+        detail_param = 'true' if detail else 'false'
+        if '' in folders:
+            report_params.append({'detail': detail_param})
+        if subfolders:
+            report_params.append({'folders': ','.join(subfolders),
+                                  'detail': detail_param})
+
+        for data in report_params:
+            report = self._make_request('services/report', data=data)
+            if report and 'reports' in report:
+                entries.extend(report['reports'])
+
+        return entries
+
+    def get_service_states(self, folders: List[str]) -> Dict[Tuple[str, str, str], str]:
+        """
+        Fetch configuredState for services in the given folders via the
+        services/report endpoint.
+
+        Args:
+            folders: Folder names to report on; include '' for the root folder
+
+        Returns:
+            Mapping of (folder, name, type) to configuredState; empty if the
+            server does not support services/report
+        """
+        return {
+            (entry.get('folderName', ''), entry['serviceName'], entry['type']):
+                entry.get('configuredState', '')
+            for entry in self._get_service_reports(folders, detail=True)
+        }
+
+    def get_service_details(self, folder: str, service_name: str, service_type: str) -> Optional[Dict]:
+        """
+        Get detailed information about a specific service.
+        
+        Args:
+            folder: Service folder (empty string for root)
+            service_name: Service name
+            service_type: Service type (e.g., 'MapServer')
+            
+        Returns:
+            Service details dictionary
+        """
+        cache_key = (folder, service_name, service_type)
+        with self._cache_lock:
+            if cache_key in self._details_cache:
+                return self._details_cache[cache_key]
+
+        details = self._make_request(self._endpoint(folder, service_name, service_type))
+        if details:
+            with self._cache_lock:
+                self._details_cache[cache_key] = details
+        return details
+
+    def _invalidate_details_cache(self, folder: str, service_name: str, service_type: str):
+        """Drop cached responses for a service after its config or state changes."""
+        prefix = self._endpoint(folder, service_name, service_type)
+        with self._cache_lock:
+            self._details_cache.pop((folder, service_name, service_type), None)
+
+            # Also drop memoized GETs for this service's endpoints, plus any
+            # services/report responses since they embed per-service state
+            stale = [key for key in self._get_cache
+                     if key[0].startswith(prefix) or key[0] == 'services/report']
+            for key in stale:
+                self._get_cache.pop(key, None)
+    
+    @staticmethod
+    def _is_partial_edit_rejection(error: Dict) -> bool:
+        """
+        True when an /edit API error indicates the service JSON itself was
+        rejected (older servers that cannot merge partial payloads complain
+        about invalid or missing service properties).
+        """
+        message = error.get('message', '').lower()
+        return any(hint in message for hint in
+                   ('invalid service', 'missing', 'required', 'json'))
+
+    def start_service(self, folder: str, service_name: str, service_type: str) -> bool:
+        """Start a service."""
+        endpoint = self._endpoint(folder, service_name, service_type, 'start')
+        result = self._make_request(endpoint, method='POST')
+        success = result is not None and result.get('status') == 'success'
+        if success:
+            self._invalidate_details_cache(folder, service_name, service_type)
+        return success
+    
+    def stop_service(self, folder: str, service_name: str, service_type: str) -> bool:
+        """Stop a service."""
+        endpoint = self._endpoint(folder, service_name, service_type, 'stop')
+        result = self._make_request(endpoint, method='POST')
+        success = result is not None and result.get('status') == 'success'
+        if success:
+            self._invalidate_details_cache(folder, service_name, service_type)
+        return success
+    
+    def update_service_instances(self, folder: str, service_name: str, service_type: str, 
+                               min_instances: int, max_instances: int) -> bool:
+        """
+        Update the min/max instances for a service.
+        
+        Args:
+            folder: Service folder
+            service_name: Service name
+            service_type: Service type
+            min_instances: Minimum instances
+            max_instances: Maximum instances
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        # Skip the edit entirely when cached details show the values already
+        # match; don't issue a GET just for this comparison
+        with self._cache_lock:
+            cached = self._details_cache.get((folder, service_name, service_type))
+        if (cached is not None
+                and cached.get('minInstancesPerNode') == min_instances
+                and cached.get('maxInstancesPerNode') == max_instances):
+            return True
+
+        endpoint = self._endpoint(folder, service_name, service_type, 'edit')
+
+        # Prefer a partial service JSON so we skip the GET and only send the two
+        # changed fields; the server merges it into the existing configuration
+        if self._supports_partial_edit:
+            edit_data = {
+                'service': _json_dumps({
+                    'minInstancesPerNode': min_instances,
+                    'maxInstancesPerNode': max_instances
+                })
+            }
+            result = self._make_request(endpoint, data=edit_data, method='POST')
+            if result is not None and result.get('status') == 'success':
+                self._invalidate_details_cache(folder, service_name, service_type)
+                return True
+
+            # Only fall back to full-config edits when the API error says the
+            # payload itself was rejected. Transport errors, 5xx responses,
+            # and service-specific failures must not poison the global flag
+            # (they surface as last_api_error=None or an unrelated message).
+            error = getattr(self._local, 'last_api_error', None)
+            if error is None or not self._is_partial_edit_rejection(error):
+                return False
+            self._supports_partial_edit = False
+
+        # Full-config path: get current configuration and resubmit it edited.
+        # Build a fresh payload rather than mutating the (possibly cached) dict
+        service_details = self.get_service_details(folder, service_name, service_type)
+        if not service_details:
+            return False
+
+        # The freshly fetched config may already match the requested values
+        if (service_details.get('minInstancesPerNode') == min_instances
+                and service_details.get('maxInstancesPerNode') == max_instances):
+            return True
+
+        edit_payload = {k: v for k, v in service_details.items()
+                        if k not in _READONLY_PROPS}
+        edit_payload['minInstancesPerNode'] = min_instances
+        edit_payload['maxInstancesPerNode'] = max_instances
+
+        edit_data = {
+            'service': _json_dumps(edit_payload)
+        }
+
+        result = self._make_request(endpoint, data=edit_data, method='POST')
+        success = result is not None and result.get('status') == 'success'
+        if success:
+            self._invalidate_details_cache(folder, service_name, service_type)
+        return success
+    
+    def save_services_state(self, output_file: str) -> bool:
+        """
+        Save current service states and instance settings to CSV.
+        
+        Args:
+            output_file: Output CSV file path
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        # Excluded folders are filtered out during enumeration
+        services = self.get_services()
+        if not services:
+            logger.error("No services found or failed to retrieve services")
+            return False
+
+        try:
+            # Plain csv.writer with tuple rows skips per-row dict construction;
+            # the 1 MiB buffer batches the underlying file writes
+            with open(output_file, 'w', newline='', encoding='utf-8',
+                      buffering=1 << 20) as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(('folder', 'service_name', 'service_type',
+                                 'configured_state', 'min_instances', 'max_instances'))
+
+                # One detailed report per folder set replaces a GET per service
+                report_map = {
+                    (entry.get('folderName', ''), entry['serviceName'], entry['type']): entry
+                    for entry in self._get_service_reports(
+                        sorted({s['folder'] for s in services}), detail=True)
+                }
+
+                details_list = []
+                missing = []
+                for service in services:
+                    entry = report_map.get((service['folder'], service['name'], service['type']))
+                    if entry and all(k in entry for k in
+                                     ('configuredState', 'minInstancesPerNode',
+                                      'maxInstancesPerNode')):
+                        details_list.append((service, entry))
+                    else:
+                        missing.append(service)
+
+                # Fall back to per-service detail GETs (in parallel) only for
+                # services the report left incomplete
+                if missing:
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        details_list.extend(executor.map(
+                            lambda s: (s, self.get_service_details(s['folder'], s['name'], s['type'])),
+                            missing))
+
+                for service, details in details_list:
+                    if details:
+                        writer.writerow((
+                            service['folder'],
+                            service['name'],
+                            service['type'],
+                            details.get('configuredState', 'STOPPED'),
+                            details.get('minInstancesPerNode', 1),
+                            details.get('maxInstancesPerNode', 1)
+                        ))
+                        logger.info(f"Saved: {service['folder']}/{service['name']}.{service['type']}")
+            
+            logger.info(f"Service states saved to {output_file}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to save services state: {e}")
+            return False
+    
+    def stop_all_except_one(self, keep_service: str) -> bool:
+        """
+        Stop all services except one, and set that service's instances to 1/1.
+        
+        Args:
+            keep_service: Name of the service to keep running
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        # Excluded folders are filtered out during enumeration
+        services = self.get_services()
+        if not services:
+            logger.error("No services found or failed to retrieve services")
+            return False
+
+        kept_service_found = False
+        services_to_stop = []
+
+        for service in services:
+
+            service_full_name = f"{service['name']}.{service['type']}"
+            service_path = f"{service['folder']}/{service_full_name}" if service['folder'] else service_full_name
+
+            if service['name'] == keep_service:
+                # This is the service to keep running
+                logger.info(f"Keeping service running: {service_path}")
+
+                # Set instances to 1/1
+                if self.update_service_instances(service['folder'], service['name'],
+                                               service['type'], 1, 1):
+                    logger.info(f"Updated instances to 1/1 for {service_path}")
+                else:
+                    logger.error(f"Failed to update instances for {service_path}")
+
+                # Ensure it's started
+                if self.start_service(service['folder'], service['name'], service['type']):
+                    logger.info(f"Started service: {service_path}")
+                else:
+                    logger.error(f"Failed to start service: {service_path}")
+
+                kept_service_found = True
+            else:
+                services_to_stop.append((service, service_path))
+
+        # Dispatch all stops in parallel; each /stop returns once the transition
+        # is underway, so total wall time is the slowest stop, not the sum
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            stop_results = list(executor.map(
+                lambda item: (item, self.stop_service(item[0]['folder'], item[0]['name'], item[0]['type'])),
+                services_to_stop))
+
+        dispatched = []
+        for (service, service_path), accepted in stop_results:
+            if accepted:
+                dispatched.append((service, service_path))
+            else:
+                logger.error(f"Failed to stop service: {service_path}")
+
+        # Verify final states in a single report pass instead of per-service polls
+        if dispatched:
+            states = self.get_service_states(sorted({s['folder'] for s, _ in dispatched}))
+            for service, service_path in dispatched:
+                state = states.get((service['folder'], service['name'], service['type']))
+                if state is None or state.upper() == 'STOPPED':
+                    logger.info(f"Stopped service: {service_path}")
+                else:
+                    logger.error(f"Service did not stop: {service_path} (state: {state})")
+
+        if not kept_service_found:
+            logger.warning(f"Warning: Service '{keep_service}' not found!")
+            return False
+        
+        logger.info("Service shutdown complete")
+        return True
+    
+    def restore_services_state(self, input_file: str) -> bool:
+        """
+        Restore service states and instance settings from CSV.
+        Excludes services in Hosted, System, and Utilities folders.
+        
+        Args:
+            input_file: Input CSV file path
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            restored_count = 0
+            skipped_count = 0
+            
+            if pd is not None:
+                # Vectorized parse and excluded-folder filter
+                df = pd.read_csv(input_file, keep_default_na=False,
+                                 dtype={'folder': str, 'service_name': str,
+                                        'service_type': str, 'configured_state': str,
+                                        'min_instances': 'int32',
+                                        'max_instances': 'int32'})
+                excluded_mask = df['folder'].isin(self.excluded_folders)
+                for row in df[excluded_mask].itertuples():
+                    logger.warning(f"Skipping excluded service: "
+                                   f"{row.folder}/{row.service_name}.{row.service_type}")
+                skipped_count = int(excluded_mask.sum())
+                rows = df[~excluded_mask].to_dict('records')
+            else:
+                with open(input_file, 'r', encoding='utf-8') as csvfile:
+                    rows = list(csv.DictReader(csvfile))
+
+            # One detailed report pass tells us which services already have
+            # their target state and instance settings, so redundant edit and
+            # start/stop calls can be skipped
+            report_entries = {
+                (entry.get('folderName', ''), entry['serviceName'], entry['type']): entry
+                for entry in self._get_service_reports(
+                    sorted({row['folder'] for row in rows
+                            if row['folder'] not in self.excluded_folders}),
+                    detail=True)
+            }
+
+            for row in rows:
+                folder = row['folder']
+                service_name = row['service_name']
+                service_type = row['service_type']
+                configured_state = row['configured_state']
+                min_instances = int(row['min_instances'])
+                max_instances = int(row['max_instances'])
+
+                # Skip services in excluded folders
+                if folder in self.excluded_folders:
+                    service_path = f"{folder}/{service_name}.{service_type}"
+                    logger.warning(f"Skipping excluded service: {service_path}")
+                    skipped_count += 1
+                    continue
+
+                service_path = f"{folder}/{service_name}.{service_type}" if folder else f"{service_name}.{service_type}"
+                entry = report_entries.get((folder, service_name, service_type))
+
+                # Update instances, skipping the edit when the report already
+                # shows the stored values
+                if (entry is not None
+                        and entry.get('minInstancesPerNode') == min_instances
+                        and entry.get('maxInstancesPerNode') == max_instances):
+                    logger.info(f"Instances already {min_instances}/{max_instances} for {service_path}")
+                elif self.update_service_instances(folder, service_name, service_type,
+                                               min_instances, max_instances):
+                    logger.info(f"Updated instances for {service_path}: {min_instances}/{max_instances}")
+                else:
+                    logger.error(f"Failed to update instances for {service_path}")
+                    continue
+
+                # Set service state, skipping services already in the target state
+                current = entry.get('configuredState', '').upper() if entry else ''
+                if configured_state.upper() == 'STARTED':
+                    if current == 'STARTED':
+                        logger.info(f"Service already started: {service_path}")
+                        restored_count += 1
+                    elif self.start_service(folder, service_name, service_type):
+                        logger.info(f"Started service: {service_path}")
+                        restored_count += 1
+                    else:
+                        logger.error(f"Failed to start service: {service_path}")
+                else:
+                    if current == 'STOPPED':
+                        logger.info(f"Service already stopped: {service_path}")
+                        restored_count += 1
+                    elif self.stop_service(folder, service_name, service_type):
+                        logger.info(f"Stopped service: {service_path}")
+                        restored_count += 1
+                    else:
+                        logger.error(f"Failed to stop service: {service_path}")
+            
+            logger.info(f"Service restoration complete ({restored_count} services restored, {skipped_count} services skipped)")
+            if skipped_count > 0:
+                logger.info(f"Excluded folders: {', '.join(self.excluded_folders)}")
+            return True
+            
+        except FileNotFoundError:
+            logger.error(f"Input file '{input_file}' not found")
+            return False
+        except Exception as e:
+            logger.error(f"Failed to restore services state: {e}")
+            return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ArcGIS Server Service Manager')
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+
+    # Common arguments shared by all commands via a parent parser
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--server', required=True,
+                        help='ArcGIS Server URL (e.g., https://server:6443)')
+    common.add_argument('--username', required=True,
+                        help='Primary Site Administrator username')
+    common.add_argument('--password', required=True,
+                        help='Primary Site Administrator password')
+
+    # Save command
+    save_parser = subparsers.add_parser('save', parents=[common],
+                                        help='Save current service states to CSV')
+    save_parser.add_argument('--output', required=True,
+                           help='Output CSV file path')
+
+    # Stop command
+    stop_parser = subparsers.add_parser('stop', parents=[common],
+                                        help='Stop all services except one')
+    stop_parser.add_argument('--keep-service', required=True,
+                           help='Name of service to keep running')
+
+    # Restore command
+    restore_parser = subparsers.add_parser('restore', parents=[common],
+                                           help='Restore service states from CSV')
+    restore_parser.add_argument('--input', required=True,
+                              help='Input CSV file path')
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    # Per-service progress goes through logging; raise the level to WARNING
+    # to silence it for production runs
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+
+    # Initialize manager and authenticate
+    manager = ArcGISServerManager(args.server, args.username, args.password)
+    
+    if not manager.authenticate():
+        logger.error("Authentication failed")
+        return 1
+    
+    # Execute command
+    success = False
+    
+    if args.command == 'save':
+        success = manager.save_services_state(args.output)
+    elif args.command == 'stop':
+        success = manager.stop_all_except_one(args.keep_service)
+    elif args.command == 'restore':
+        success = manager.restore_services_state(args.input)
+    
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
     sys.exit(main())
\ No newline at end of file